@@ -20,6 +20,6 @@ __title__ = 'message_bus'
 from cortx.utils.message_bus.error import MessageBusError
 from cortx.utils.message_bus.message_bus import MessageBus
 from cortx.utils.message_bus.message_bus_client import MessageProducer, \
-    MessageConsumer, MessageBusAdmin
+    MessageConsumer, MessageBusAdmin, AsyncMessageProducer
 from cortx.utils.message_bus.message_broker import MessageBroker, MessageBrokerFactory
 from cortx.utils.message_bus.message_bus_server import MessageBusRequestHandler
\ No newline at end of file
@@ -96,7 +96,7 @@ class MessageBroker:
         pass
 
     def send(self, producer_id: str, message_type: str, method: str, \
-        messages: list):
+        messages: list, key: str = None):
         pass
 
     def receive(self, consumer_id: str) -> list:
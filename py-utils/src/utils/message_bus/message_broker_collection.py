@@ -317,7 +317,7 @@ class KafkaMessageBroker(MessageBroker):
                 %s", err)
 
     def send(self, producer_id: str, message_type: str, method: str, \
-        messages: list, timeout=0.1):
+        messages: list, timeout=0.1, key: str = None):
         """
         Sends list of messages to Kafka cluster(s)
 
@@ -327,6 +327,7 @@ class KafkaMessageBroker(MessageBroker):
                         queue/topic name. For e.g. "Alert"
         method          Can be set to "sync" or "async"(default).
         messages        A list of messages sent to Kafka Message Server
+        key             Partition key of the messages (optional)
         """
         Log.debug(f"Producer {producer_id} sending list of messages " \
             f"{messages} of message type {message_type} to kafka server" \
@@ -341,7 +342,7 @@ class KafkaMessageBroker(MessageBroker):
 
         for message in messages:
             producer.produce(message_type, bytes(message, 'utf-8'), \
-                callback=self.delivery_callback)
+                key=key, callback=self.delivery_callback)
             if method == 'sync':
                 producer.flush()
             else:
@@ -107,9 +107,11 @@ class MessageBus(metaclass=Singleton):
             concurrency_count)
 
     @staticmethod
-    def send(client_id: str, message_type: str, method: str, messages: list):
+    def send(client_id: str, message_type: str, method: str, messages: list, \
+        key: str = None):
         """Sends list of messages to the configured message broker."""
-        MessageBus._broker.send(client_id, message_type, method, messages)
+        MessageBus._broker.send(client_id, message_type, method, messages, \
+            key=key)
 
     @staticmethod
     def delete(client_id: str, message_type: str):
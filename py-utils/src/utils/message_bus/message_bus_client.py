@@ -15,35 +15,152 @@
 # For any questions about this software or licensing,
 # please email opensource@seagate.com or cortx-questions@seagate.com.
 
+import time
 import errno
+import asyncio
+import threading
+from collections import defaultdict, deque
+from typing import NamedTuple
 
 from cortx.utils.log import Log
 from cortx.utils.message_bus import MessageBus
 from cortx.utils.message_bus.error import MessageBusError
 
+# Message to string converters by exact message type, subclasses of str and
+# KvPayload are registered on first use by _get_converter
+_CONVERTERS = {str: lambda message: message}
+
+
+def _get_converter(message):
+    """ Resolve and register the converter for a new message type """
+    from cortx.utils.kv_store import KvPayload
+
+    message_type = type(message)
+    if issubclass(message_type, KvPayload):
+        converter = lambda message: message.json
+    elif issubclass(message_type, str):
+        converter = _CONVERTERS[str]
+    else:
+        raise MessageBusError(errno.EINVAL, "Invalid message format, \
+            not of type KvPayload or str. %s", message)
+    _CONVERTERS[message_type] = converter
+    return converter
+
+
+class _BatchBuffer:
+    """ Accumulates serialized messages until a flush threshold is reached """
+
+    # Multiple of the thresholds the buffer may grow to while flushes fail
+    pending_factor = 10
+
+    __slots__ = ('max_messages', 'max_bytes', 'linger_ms', 'lock', 'timer', \
+        '_messages', '_sizes', '_count', '_size')
+
+    def __init__(self, max_messages: int, max_bytes: int, linger_ms: int):
+        """
+        Parameters:
+        max_messages    Number of buffered messages that triggers a flush
+        max_bytes       Buffered UTF-8 encoded payload size in bytes that
+                        triggers a flush, 0 disables the size threshold
+        linger_ms       Time in milliseconds a message may wait in the
+                        buffer before it is flushed, 0 disables the timer
+        """
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.linger_ms = linger_ms
+        self.lock = threading.Lock()
+        self.timer = None
+        self._messages = defaultdict(list)
+        self._sizes = defaultdict(int)
+        self._count = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, messages: list, key: str = None) -> bool:
+        """ Adds messages and returns True if the buffer has to be flushed """
+        self._messages[key].extend(messages)
+        self._count += len(messages)
+        if self.max_bytes > 0:
+            size = sum(len(message.encode('utf-8')) for message in messages)
+            self._sizes[key] += size
+            self._size += size
+            if self._size >= self.max_bytes:
+                return True
+        return self._count >= self.max_messages
+
+    def full(self) -> bool:
+        """ Returns True if failed flushes let the buffer reach its cap """
+        if self._count >= self.max_messages * self.pending_factor:
+            return True
+        return self.max_bytes > 0 and \
+            self._size >= self.max_bytes * self.pending_factor
+
+    def items(self) -> list:
+        """
+        Returns the buffered messages as a list of (key, messages) in the
+        order the keys were first buffered
+        """
+        return list(self._messages.items())
+
+    def remove(self, key: str):
+        """ Removes the messages of key, once they were sent """
+        self._count -= len(self._messages.pop(key))
+        self._size -= self._sizes.pop(key, 0)
+
+
+class _ClientConf(NamedTuple):
+    """ Read-only client configuration """
+    client_id: str = None
+    message_type: str = None
+    method: str = None
+    consumer_group: str = None
+    message_types: tuple = None
+    auto_ack: str = None
+    offset: str = None
+
 
 class MessageBusClient:
     """ common infrastructure for producer and consumer """
 
+    __slots__ = ('_client_conf', '_batch')
+
     def __init__(self, client_type: str, **client_conf: dict):
+        try:
+            conf = _ClientConf(**client_conf)
+        except TypeError as e:
+            raise MessageBusError(errno.EINVAL, "Invalid client config %s. %s", \
+                client_conf, e)
+        if conf.message_types is not None:
+            conf = conf._replace(message_types=tuple(conf.message_types))
         MessageBus.init_client(client_type, **client_conf)
-        self._client_conf = client_conf
-        Log.debug(f"MessageBusClient: initialized with arguments" \
-            f" client_type: {client_type}, kwargs: {client_conf}")
+        self._client_conf = conf
+        self._batch = None
+        Log.debug("MessageBusClient: initialized with arguments" \
+            " client_type: %s, kwargs: %s", client_type, client_conf)
+
+    def close(self):
+        """
+        Sends the messages pending in the batch buffer. The underlying
+        broker client is kept by the message broker per client_id.
+        """
+        self.flush()
 
     def _get_conf(self, key: str):
-        """ To get the client configurations """
-        if key not in self._client_conf.keys():
-            Log.error(f"MessageBusError: {errno.ENOENT}. Could not" \
-                f" find key {key} in client config {self._client_conf}")
+        """ To get the client configurations, None marks a missing key """
+        value = getattr(self._client_conf, key)
+        if value is None:
+            client_conf = self._client_conf._asdict()
+            Log.error("MessageBusError: %s. Could not find key %s in" \
+                " client config %s", errno.ENOENT, key, client_conf)
             raise MessageBusError(errno.ENOENT, "Could not find key %s in " +\
-                "client config %s", key, self._client_conf)
-        return self._client_conf[key]
+                "client config %s", key, client_conf)
+        return value
 
     def list_message_types(self) -> list:
         """ Returns list of available message types """
-        client_id = self._get_conf('client_id')
-        return MessageBus.list_message_types(client_id)
+        return MessageBus.list_message_types(self._client_conf.client_id)
 
     def register_message_type(self, message_types: list, partitions: int):
         """
@@ -55,8 +172,14 @@ class MessageBusClient:
         partitions       Integer that represents number of partitions to be
                          created.
         """
-        client_id = self._get_conf('client_id')
-        MessageBus.register_message_type(client_id, message_types, partitions)
+        if not message_types or any(not isinstance(message_type, str) or \
+            not message_type for message_type in message_types):
+            raise MessageBusError(errno.EINVAL, "Invalid message types %s.", \
+                message_types)
+        # Broker registers the whole list in one request, drop duplicates
+        message_types = list(dict.fromkeys(message_types))
+        MessageBus.register_message_type(self._client_conf.client_id, \
+            message_types, partitions)
 
     def deregister_message_type(self, message_types: list):
         """
@@ -66,8 +189,8 @@ class MessageBusClient:
         message_types    This is essentially equivalent to the list of queue
                          topic name. For e.g. ["Alert"]
         """
-        client_id = self._get_conf('client_id')
-        MessageBus.deregister_message_type(client_id, message_types)
+        MessageBus.deregister_message_type(self._client_conf.client_id, \
+            message_types)
 
     def add_concurrency(self, message_type: str, concurrency_count: int):
         """
@@ -78,52 +201,138 @@ class MessageBusClient:
                              For e.g. "Alert"
         concurrency_count    Integer to achieve concurrency among consumers
         """
-        client_id = self._get_conf('client_id')
-        MessageBus.add_concurrency(client_id, message_type, \
+        MessageBus.add_concurrency(self._client_conf.client_id, message_type, \
             concurrency_count)
 
     @staticmethod
     def _get_str_message_list(messages: list) -> list:
         """ Convert the format of message to string """
-        from cortx.utils.kv_store import KvPayload
-
+        # Pre-serialized lists are passed through without copying, the
+        # first/last checks reject mixed lists before scanning them
+        if type(messages) is list and (not messages or \
+            (type(messages[0]) is str and type(messages[-1]) is str and \
+            all(type(message) is str for message in messages))):
+            return messages
+        converters = _CONVERTERS
         message_list = []
         for message in messages:
-            if isinstance(message, KvPayload):
-                message = message.json
-
-            if not isinstance(message, str):
-                raise MessageBusError(errno.EINVAL, "Invalid message format, \
-                    not of type KvPayload or str. %s", message)
-            message_list.append(message)
+            converter = converters.get(type(message))
+            if converter is None:
+                converter = _get_converter(message)
+            message_list.append(converter(message))
         return message_list
 
-    def send(self, messages: list):
+    def send(self, messages: list, key: str = None):
         """
         Sends list of messages to the Message Bus
 
+        Without batching (the default) messages are sent right away. When
+        batching is enabled, messages are accumulated in the batch buffer and
+        handed over to the Message Bus once max_messages or max_bytes is
+        reached, or linger_ms has elapsed. Messages are buffered per key and
+        each key is flushed with its own send, so messages sharing a key are
+        delivered to the same partition in the order they were sent.
+
+        A batched send either accepts the messages or raises without
+        buffering any of them. If the flush triggered by a send fails, the
+        error is logged and the messages stay buffered for the next flush;
+        flush() and close() raise it. Once failed flushes let the buffer
+        grow to 10 times max_messages (or max_bytes), send() retries the
+        flush first and rejects the messages with EAGAIN if it fails again.
+
         Parameters:
         messages     A list of messages sent to Message Bus
+        key          Partition key of the messages (optional)
         """
         message_type = self._get_conf('message_type')
-        method = self._get_conf('method')
-        client_id = self._get_conf('client_id')
         messages = self._get_str_message_list(messages)
-        MessageBus.send(client_id, message_type, method, messages)
+        conf = self._client_conf
+        batch = self._batch
+        if batch is None:
+            MessageBus.send(conf.client_id, message_type, conf.method, \
+                messages, key)
+            return
+        with batch.lock:
+            if batch.full():
+                self._flush_deferred()
+            if batch.full():
+                raise MessageBusError(errno.EAGAIN, "Batch buffer of %s is" \
+                    " full, %d messages pending.", conf.client_id, len(batch))
+            if batch.append(messages, key):
+                self._flush_deferred()
+            elif batch.linger_ms > 0 and batch.timer is None:
+                batch.timer = threading.Timer(batch.linger_ms / 1000, \
+                    self._linger_expired)
+                batch.timer.daemon = True
+                batch.timer.start()
+
+    def _linger_expired(self):
+        """ Flushes the batch buffer once linger_ms has elapsed """
+        with self._batch.lock:
+            self._flush_deferred()
+
+    def _flush_deferred(self):
+        """
+        Sends the buffered messages, caller must hold the batch lock. A
+        failure is logged and the messages are kept for the next flush.
+        """
+        try:
+            self._flush()
+        except Exception as e:
+            Log.error("MessageBusError: Failed to flush %s messages of %s," \
+                " kept for the next flush. %s", len(self._batch), \
+                self._client_conf.client_id, e)
+
+    def _flush(self):
+        """
+        Sends the buffered messages, caller must hold the batch lock.
+        Messages of a key are removed from the buffer only after they were
+        sent, so a failed send keeps them (and the keys after it) for the
+        next flush.
+        """
+        batch = self._batch
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        conf = self._client_conf
+        for key, messages in batch.items():
+            MessageBus.send(conf.client_id, conf.message_type, conf.method, \
+                messages, key)
+            batch.remove(key)
+
+    def flush(self):
+        """ Sends all the messages pending in the batch buffer """
+        batch = self._batch
+        if batch is None:
+            return
+        with batch.lock:
+            self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        batch = getattr(self, '_batch', None)
+        if batch is not None and len(batch) > 0:
+            try:
+                self.flush()
+            except Exception:
+                pass
 
     def delete(self):
         """ Deletes the messages """
         message_type = self._get_conf('message_type')
-        client_id = self._get_conf('client_id')
-        return MessageBus.delete(client_id, message_type)
+        return MessageBus.delete(self._client_conf.client_id, message_type)
 
     def set_message_type_expire(self, message_type: str, **kwargs):
         """Set expiration time for given message type."""
-        client_id = self._get_conf('client_id')
-        status = MessageBus.set_message_type_expire(client_id, message_type, \
-            **kwargs)
-        Log.info(f"Successfully updated {message_type} with new"+\
-            " configuration.")
+        status = MessageBus.set_message_type_expire(\
+            self._client_conf.client_id, message_type, **kwargs)
+        Log.info("Successfully updated %s with new configuration.", \
+            message_type)
         return status
 
     def receive(self, timeout: float = None) -> list:
@@ -133,18 +342,18 @@ class MessageBusClient:
         Parameters:
         timeout     Time in seconds to wait for the message.
         """
-        client_id = self._get_conf('client_id')
-        return MessageBus.receive(client_id, timeout)
+        return MessageBus.receive(self._client_conf.client_id, timeout)
 
     def ack(self):
         """ Provides acknowledgement on offset """
-        client_id = self._get_conf('client_id')
-        MessageBus.ack(client_id)
+        MessageBus.ack(self._client_conf.client_id)
 
 
 class MessageBusAdmin(MessageBusClient):
     """ A client that do admin jobs """
 
+    __slots__ = ()
+
     def __init__(self, admin_id: str):
         """ Initialize a Message Admin
 
@@ -158,7 +367,10 @@ class MessageBusAdmin(MessageBusClient):
 class MessageProducer(MessageBusClient):
     """ A client that publishes messages """
 
-    def __init__(self, producer_id: str, message_type: str, method: str = None):
+    __slots__ = ()
+
+    def __init__(self, producer_id: str, message_type: str, method: str = None,\
+        max_messages: int = 1, max_bytes: int = 0, linger_ms: int = 0):
         """ Initialize a Message Producer
 
         Parameters:
@@ -166,16 +378,111 @@ class MessageProducer(MessageBusClient):
         producer_id     A String that represents Producer client ID.
         message_type    This is essentially equivalent to the
                         queue/topic name. For e.g. "Alert"
+        max_messages    Number of messages batched before they are sent.
+                        Default 1 disables batching and sends on every call.
+        max_bytes       UTF-8 encoded size in bytes of batched messages
+                        before they are sent. Default 0 disables the size
+                        threshold.
+        linger_ms       Time in milliseconds batched messages wait before
+                        they are sent. Default 0 waits for the thresholds
+                        or an explicit flush().
         """
         super().__init__(client_type='producer', client_id=producer_id, \
             message_type=message_type, method=method)
+        if max_messages > 1:
+            self._batch = _BatchBuffer(max_messages, max_bytes, linger_ms)
+
+
+class AsyncMessageProducer(MessageProducer):
+    """ A producer that pipelines sends issued from asyncio coroutines """
+
+    __slots__ = ('_max_batch', '_queue', '_drain_task', '_error')
+
+    def __init__(self, producer_id: str, message_type: str, method: str = None,\
+        max_batch: int = 100):
+        """ Initialize an Async Message Producer
+
+        Parameters:
+        producer_id     A String that represents Producer client ID.
+        message_type    This is essentially equivalent to the
+                        queue/topic name. For e.g. "Alert"
+        max_batch       Maximum number of queued messages handed over to
+                        the Message Bus in one send.
+        """
+        super().__init__(producer_id=producer_id, message_type=message_type, \
+            method=method)
+        self._max_batch = max_batch
+        self._queue = None
+        self._drain_task = None
+        self._error = None
+
+    async def send_async(self, messages: list):
+        """
+        Queues list of messages to be sent to the Message Bus by a single
+        background task, which coalesces queued messages into bulk sends
+
+        Parameters:
+        messages     A list of messages sent to Message Bus
+        """
+        messages = self._get_str_message_list(messages)
+        if self._drain_task is None:
+            # Called from a coroutine, so this is the running loop
+            loop = asyncio.get_event_loop()
+            self._queue = asyncio.Queue()
+            self._drain_task = asyncio.ensure_future(self._drain(loop))
+        for message in messages:
+            self._queue.put_nowait(message)
+
+    async def _drain(self, loop):
+        """ Sends queued messages in batches of up to max_batch """
+        queue = self._queue
+        conf = self._client_conf
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < self._max_batch:
+                batch.append(queue.get_nowait())
+            try:
+                await loop.run_in_executor(None, MessageBus.send, \
+                    conf.client_id, conf.message_type, conf.method, batch)
+            except Exception as e:
+                Log.error("MessageBusError: Failed to send %s messages of " \
+                    "%s. %s", len(batch), conf.client_id, e)
+                # Drop the traceback, it references this coroutine's frame
+                self._error = e.with_traceback(None)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def flush_async(self):
+        """
+        Waits until all queued messages are sent, raises the last send
+        error if any
+        """
+        if self._queue is not None:
+            await self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def close_async(self):
+        """ Sends the queued messages and stops the background task """
+        try:
+            await self.flush_async()
+        finally:
+            if self._drain_task is not None:
+                self._drain_task.cancel()
+                self._drain_task = None
+            self.close()
 
 
 class MessageConsumer(MessageBusClient):
     """ A client that consumes messages """
 
+    __slots__ = ('_prefetch_buf', '_commit_interval', '_uncommitted', \
+        '_delivered', '_ack_pending')
+
     def __init__(self, consumer_id: str, consumer_group: str, auto_ack: str, \
-        message_types: list, offset: str):
+        message_types: list, offset: str, commit_interval: int = 0):
         """ Initialize a Message Consumer
 
         Parameters:
@@ -189,7 +496,138 @@ class MessageConsumer(MessageBusClient):
         offset          Can be set to "earliest" (default) or "latest".
                         ("earliest" will cause messages to be read from the
                         beginning)
+        commit_interval Number of processed messages after which an ack is
+                        issued automatically, 0 (default) disables it.
+                        Messages returned by receive(), receive_batch() or
+                        iter_messages() count as processed once the next
+                        message or batch is requested. Only meaningful when
+                        auto_ack is "False".
         """
         super().__init__(client_type='consumer', client_id=consumer_id, \
             consumer_group=consumer_group, message_types=message_types, \
             auto_ack=auto_ack, offset=offset)
+        self._prefetch_buf = deque()
+        self._commit_interval = commit_interval
+        self._uncommitted = 0
+        self._delivered = 0
+        self._ack_pending = False
+
+    def _processed(self):
+        """
+        Counts the messages delivered by the previous call as processed and
+        acks once commit_interval of them are. An ack commits the consumer
+        position, which is past every prefetched message, so no ack is
+        issued while the prefetch buffer still holds messages.
+        """
+        self._uncommitted += self._delivered
+        self._delivered = 0
+        if self._prefetch_buf:
+            return
+        if self._ack_pending or (self._commit_interval > 0 and \
+            self._uncommitted >= self._commit_interval):
+            self.ack()
+
+    def ack(self):
+        """ Provides acknowledgement on offset """
+        super().ack()
+        self._uncommitted = 0
+        self._delivered = 0
+        self._ack_pending = False
+
+    def receive(self, timeout: float = None) -> list:
+        """
+        Receives messages from the Message Bus
+
+        Parameters:
+        timeout     Time in seconds to wait for the message.
+        """
+        self._processed()
+        if self._prefetch_buf:
+            message = self._prefetch_buf.popleft()
+        else:
+            message = super().receive(timeout)
+        if message is not None:
+            self._delivered = 1
+        return message
+
+    def receive_batch(self, max_messages: int, timeout: float = None) -> list:
+        """
+        Receives up to max_messages messages from the Message Bus
+
+        Parameters:
+        max_messages    Maximum number of messages to be returned.
+        timeout         Time in seconds to wait for the batch to fill up.
+                        If None, every message is waited for with the
+                        default receive timeout. If 0, blocks until the
+                        first message arrives, the rest of the batch is
+                        waited for with the default receive timeout.
+        """
+        self._processed()
+        messages = self._receive_batch(max_messages, timeout)
+        self._delivered = len(messages)
+        return messages
+
+    def _receive_batch(self, max_messages: int, timeout: float) -> list:
+        """ Receives a batch, prefetched messages first """
+        messages = []
+        while self._prefetch_buf and len(messages) < max_messages:
+            messages.append(self._prefetch_buf.popleft())
+
+        deadline = None
+        if timeout:
+            deadline = time.monotonic() + timeout
+        while len(messages) < max_messages:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+            elif timeout == 0 and not messages:
+                wait = 0
+            message = MessageBus.receive(self._client_conf.client_id, wait)
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    def iter_messages(self, batch_size: int = 100, timeout: float = None):
+        """
+        Yields messages from the Message Bus, prefetching them in batches
+        of batch_size. Stops once no message arrives within timeout, with
+        timeout 0 it keeps blocking for new messages.
+        Note: an explicit ack() commits the prefetched messages as well.
+
+        Parameters:
+        batch_size      Number of messages prefetched per receive_batch.
+        timeout         Time in seconds to wait for each batch.
+        """
+        while True:
+            self._processed()
+            if not self._prefetch_buf:
+                self._prefetch_buf.extend(self._receive_batch(batch_size, \
+                    timeout))
+                if not self._prefetch_buf:
+                    return
+            message = self._prefetch_buf.popleft()
+            self._delivered = 1
+            yield message
+
+    def receive_and_ack(self, batch_size: int = 100, timeout: float = None) \
+        -> list:
+        """
+        Receives up to batch_size messages and acknowledges all of them with
+        a single ack. The consumer must be created with auto_ack "False".
+        If prefetched messages remain after the batch, the ack is deferred
+        until they were processed.
+
+        Parameters:
+        batch_size      Maximum number of messages to be returned.
+        timeout         Time in seconds to wait for the batch to fill up.
+        """
+        self._processed()
+        messages = self._receive_batch(batch_size, timeout)
+        if messages:
+            self._uncommitted += len(messages)
+            self._ack_pending = True
+            self._processed()
+        return messages
@@ -14,23 +14,44 @@
 # For any questions about this software or licensing,
 # please email opensource@seagate.com or cortx-questions@seagate.com.
 
+import os
 import sys
 import errno
-import argparse
-import inspect
+import functools
 import traceback
 
 from cortx.utils.setup.openldap import Openldap
 from cortx.utils.setup.openldap import OpenldapSetupError
 
+# Openldap instances shared by commands, keyed by config URL
+_openldap_cache = {}
+
 
 class Cmd:
     """Setup Command."""
+    __slots__ = ('_url', '_args', 'openldap')
     _index = "setup"
+    _registry = []
+    needs_config = True
 
     def __init__(self, args: dict):
         self._url = args.config
         self._args = args.args
+        self.openldap = self._make_openldap(
+            args.config if self.needs_config else None)
+
+    @classmethod
+    def register(cls, sub):
+        """Register a setup command for command line parsing."""
+        cls._registry.append(sub)
+        return sub
+
+    @staticmethod
+    def _make_openldap(url: str):
+        """Return the Openldap instance for the config URL."""
+        if url not in _openldap_cache:
+            _openldap_cache[url] = Openldap(url)
+        return _openldap_cache[url]
 
     @property
     def args(self) -> str:
@@ -52,15 +73,7 @@ class Cmd:
     @staticmethod
     def get_command(desc: str, argv: dict):
         """Return the Command after parsing the command line."""
-        parser = argparse.ArgumentParser(desc)
-
-        subparsers = parser.add_subparsers()
-        cmds = inspect.getmembers(sys.modules[__name__])
-        cmds = [(x, y) for x, y in cmds
-            if x.endswith("Cmd") and x != "Cmd"]
-        for name, cmd in cmds:
-            cmd.add_args(subparsers, cmd, name)
-        args = parser.parse_args(argv)
+        args = _build_parser(desc).parse_args(argv)
         return args.command(args)
 
     @staticmethod
@@ -78,64 +91,58 @@ class Cmd:
         parser1.set_defaults(command=cls)
 
 
+@Cmd.register
 class PostInstallCmd(Cmd):
     """PostInstall Setup Cmd."""
+    __slots__ = ()
     name = "post_install"
 
-    def __init__(self, args: dict):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.post_install()
         return rc
 
 
+@Cmd.register
 class PrepareCmd(Cmd):
     """Prepare Setup Cmd."""
+    __slots__ = ()
     name = "prepare"
 
-    def __init__(self, args: dict):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.prepare()
         return rc
 
 
+@Cmd.register
 class ConfigCmd(Cmd):
     """Setup Config Cmd."""
+    __slots__ = ()
     name = "config"
 
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.config()
         return rc
 
 
+@Cmd.register
 class InitCmd(Cmd):
     """Init Setup Cmd."""
+    __slots__ = ()
     name = "init"
 
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.init()
         return rc
 
 
+@Cmd.register
 class TestCmd(Cmd):
     """Test Setup Cmd."""
+    __slots__ = ('test_plan',)
     name = "test"
 
     @staticmethod
@@ -144,7 +151,6 @@ class TestCmd(Cmd):
 
     def __init__(self, args):
         super().__init__(args)
-        self.openldap = Openldap(args.config)
         self.test_plan = args.plan
 
     def process(self):
@@ -153,58 +159,63 @@ class TestCmd(Cmd):
         return rc
 
 
+@Cmd.register
 class ResetCmd(Cmd):
     """Reset Setup Cmd."""
+    __slots__ = ()
     name = "reset"
 
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.reset()
         return rc
 
+@Cmd.register
 class CleanupCmd(Cmd):
     """Cleanup Setup Cmd."""
+    __slots__ = ()
     name = "cleanup"
 
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(args.config)
-
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.cleanup()
         return rc
 
+@Cmd.register
 class PreUpgradeCmd(Cmd):
     """Pre Upgrade Setup Cmd."""
+    __slots__ = ()
     name = "preupgrade"
-
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(None)
+    needs_config = False
 
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.preupgrade()
         return rc
 
+@Cmd.register
 class PostUpgradeCmd(Cmd):
     """Post Upgrade Setup Cmd."""
+    __slots__ = ()
     name = "postupgrade"
-
-    def __init__(self, args):
-        super().__init__(args)
-        self.openldap = Openldap(None)
+    needs_config = False
 
     def process(self):
         # TODO: Add actions here
         rc = self.openldap.postupgrade()
         return rc
 
+@functools.lru_cache(maxsize=1)
+def _build_parser(desc: str):
+    """Build the command line parser once for all the setup commands."""
+    import argparse
+
+    parser = argparse.ArgumentParser(desc)
+    subparsers = parser.add_subparsers()
+    for cmd in Cmd._registry:
+        cmd.add_args(subparsers, cmd, cmd.__name__)
+    return parser
+
 def main(argv: dict):
     try:
         desc = "CORTX Openldap Setup command"
@@ -220,7 +231,8 @@ def main(argv: dict):
 
     except Exception as e:
         sys.stderr.write("error: %s\n\n" % str(e))
-        sys.stderr.write("%s\n" % traceback.format_exc())
+        if os.environ.get('CORTX_VERBOSE') == '1' or sys.stderr.isatty():
+            sys.stderr.write("%s\n" % traceback.format_exc())
         Cmd.usage(argv[0])
         return errno.EINVAL
 
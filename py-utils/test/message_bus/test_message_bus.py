@@ -255,6 +255,57 @@ class TestMessageBus(unittest.TestCase):
                 data_limit_bytes=1073741824 )
         self.assertIsNone(message)
 
+    def test_018_send_batched(self):
+        """Test batched messages reach the message type in order."""
+        for _ in TestMessageBus._consumer.iter_messages():
+            pass
+        TestMessageBus._consumer.ack()
+        messages = [f"Batched message {i}" for i in range(13)]
+        producer = MessageProducer(producer_id='send_batched', \
+            message_type=TestMessageBus._message_type, method='sync', \
+            max_messages=10)
+        # message type has several partitions by now, the key pins the
+        # messages to one of them so that their order is kept
+        with producer:
+            producer.send(messages[:5], key='batched')
+            producer.send(messages[5:12], key='batched')
+            producer.send(messages[12:], key='batched')
+        received = []
+        while True:
+            message = TestMessageBus._consumer.receive()
+            if message is None:
+                break
+            received.append(message)
+        TestMessageBus._consumer.ack()
+        self.assertEqual(received, \
+            [bytes(message, 'utf-8') for message in messages])
+
+    def test_019_receive_batch(self):
+        """Test receive messages in batches."""
+        for _ in TestMessageBus._consumer.iter_messages():
+            pass
+        messages = []
+        for msg_num in range(0, TestMessageBus._bulk_count):
+            messages.append("Test Message " + str(msg_num))
+        TestMessageBus._producer.send(messages)
+        received = TestMessageBus._consumer.receive_batch(\
+            TestMessageBus._bulk_count - TestMessageBus._receive_limit)
+        self.assertEqual(len(received), \
+            TestMessageBus._bulk_count - TestMessageBus._receive_limit)
+        remaining = list(TestMessageBus._consumer.iter_messages(batch_size=2))
+        self.assertEqual(len(remaining), TestMessageBus._receive_limit)
+        TestMessageBus._consumer.ack()
+
+    def test_020_receive_and_ack(self):
+        """Test receive a batch of messages with a single ack."""
+        messages = []
+        for msg_num in range(0, TestMessageBus._receive_limit):
+            messages.append("Test Message " + str(msg_num))
+        TestMessageBus._producer.send(messages)
+        received = TestMessageBus._consumer.receive_and_ack(\
+            batch_size=TestMessageBus._bulk_count)
+        self.assertEqual(len(received), TestMessageBus._receive_limit)
+
     @classmethod
     def tearDownClass(cls):
         """Deregister the test message_type."""
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+# CORTX Python common library.
+# Copyright (c) 2021 Seagate Technology LLC and/or its Affiliates
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+# For any questions about this software or licensing,
+# please email opensource@seagate.com or cortx-questions@seagate.com.
+
+import errno
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from cortx.utils.message_bus import MessageProducer, MessageConsumer, \
+    AsyncMessageProducer, MessageBusAdmin
+from cortx.utils.message_bus.error import MessageBusError
+from cortx.utils.message_bus.message_bus_client import MessageBusClient
+
+
+class TestMessageBusClient(unittest.TestCase):
+
+    """Test MessageBusClient logic against a mocked MessageBus."""
+
+    def setUp(self):
+        patcher = patch('cortx.utils.message_bus.message_bus_client.MessageBus')
+        self.message_bus = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sent(self) -> list:
+        """Return the (messages, key) of every MessageBus.send call."""
+        return [(call[0][3], call[0][4]) for call in \
+            self.message_bus.send.call_args_list]
+
+    def test_001_send_unbatched(self):
+        """Test send without batching hands the list over as is."""
+        producer = MessageProducer(producer_id='send', message_type='test')
+        messages = ["message 1", "message 2"]
+        producer.send(messages)
+        self.assertIs(self.message_bus.send.call_args[0][3], messages)
+        self.assertIsNone(producer._batch)
+
+    def test_002_send_generator(self):
+        """Test send consumes a generator of messages exactly once."""
+        producer = MessageProducer(producer_id='send', message_type='test')
+        producer.send(f"message {i}" for i in range(3))
+        self.assertEqual(self._sent(), [(["message 0", "message 1", \
+            "message 2"], None)])
+
+    def test_003_send_batched(self):
+        """Test batched send is flushed on max_messages and on exit."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=3)
+        with producer:
+            producer.send(["message 1", "message 2"])
+            self.assertEqual(self._sent(), [])
+            producer.send(["message 3"])
+            producer.send(["message 4"])
+        self.assertEqual(self._sent(), [(["message 1", "message 2", \
+            "message 3"], None), (["message 4"], None)])
+
+    def test_004_send_batched_max_bytes(self):
+        """Test max_bytes counts the UTF-8 encoded size."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=100, max_bytes=4)
+        producer.send(["é"])
+        self.assertEqual(self._sent(), [])
+        producer.send(["é"])
+        self.assertEqual(self._sent(), [(["é", "é"], None)])
+
+    def test_005_send_batched_max_bytes_keys(self):
+        """Test a sent key only releases its own size from max_bytes."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=100, max_bytes=10)
+        producer.send(["a1"], key='a')
+        producer.send(["bbb1"], key='b')
+        self.message_bus.send.side_effect = [None, OSError("broker down")]
+        with self.assertRaises(OSError):
+            producer.flush()
+        self.message_bus.send.side_effect = None
+        producer.send(["cc1"], key='c')
+        self.assertEqual(len(self._sent()), 2)
+        producer.send(["ddd1"], key='d')
+        self.assertEqual(self._sent()[2:], [(["bbb1"], 'b'), (["cc1"], 'c'), \
+            (["ddd1"], 'd')])
+
+    def test_006_send_batched_keys(self):
+        """Test batched messages keep their order per key."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=100)
+        producer.send(["a1"], key='a')
+        producer.send(["b1", "b2"], key='b')
+        producer.send(["a2"], key='a')
+        producer.send(["n1"])
+        producer.send(["b3"], key='b')
+        producer.send(["a3"], key='a')
+        producer.flush()
+        self.assertEqual(self._sent(), [(["a1", "a2", "a3"], 'a'), \
+            (["b1", "b2", "b3"], 'b'), (["n1"], None)])
+
+    def test_007_flush_failure_keeps_keys(self):
+        """Test a failed send keeps the failed and the remaining keys."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=100)
+        producer.send(["a1"], key='a')
+        producer.send(["b1"], key='b')
+        producer.send(["c1"], key='c')
+        self.message_bus.send.side_effect = [None, OSError("broker down")]
+        with self.assertRaises(OSError):
+            producer.flush()
+        self.message_bus.send.side_effect = None
+        producer.send(["b2"], key='b')
+        producer.flush()
+        self.assertEqual(self._sent()[2:], [(["b1", "b2"], 'b'), \
+            (["c1"], 'c')])
+
+    def test_008_send_flush_failure_deferred(self):
+        """Test send keeps messages on a failed flush up to the cap."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=2)
+        self.message_bus.send.side_effect = OSError("broker down")
+        for i in range(10):
+            producer.send(["message %d" % i, "message %d" % i])
+        self.assertEqual(len(producer._batch), 20)
+        with self.assertRaises(MessageBusError) as cm:
+            producer.send(["message 10"])
+        self.assertEqual(cm.exception.rc, errno.EAGAIN)
+        self.assertEqual(len(producer._batch), 20)
+        self.message_bus.send.side_effect = None
+        producer.send(["message 10"])
+        self.assertEqual(len(self._sent()[-1][0]), 20)
+        self.assertEqual(len(producer._batch), 1)
+
+    def test_009_flush_failure_keeps_messages(self):
+        """Test messages are kept in the buffer when a send fails."""
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=10)
+        producer.send(["message 1"])
+        self.message_bus.send.side_effect = OSError("broker down")
+        with self.assertRaises(OSError):
+            producer.flush()
+        self.assertEqual(len(producer._batch), 1)
+        self.message_bus.send.side_effect = None
+        producer.flush()
+        self.assertEqual(self._sent()[-1], (["message 1"], None))
+        self.assertEqual(len(producer._batch), 0)
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(coroutine)
+
+    def test_010_send_async(self):
+        """Test send_async coalesces queued messages into bulk sends."""
+        producer = AsyncMessageProducer(producer_id='send', \
+            message_type='test', max_batch=3)
+
+        async def send():
+            await asyncio.gather(*[producer.send_async([f"message {i}"]) \
+                for i in range(5)])
+            await producer.flush_async()
+            self.assertIsNotNone(producer._drain_task)
+            await producer.close_async()
+
+        self._run(send())
+        sent = [call[0][3] for call in self.message_bus.send.call_args_list]
+        self.assertEqual(sent, [["message 0", "message 1", "message 2"], \
+            ["message 3", "message 4"]])
+        self.assertIsNone(producer._drain_task)
+
+    def test_011_send_async_error(self):
+        """Test a failed background send is raised by flush_async."""
+        producer = AsyncMessageProducer(producer_id='send', \
+            message_type='test')
+        self.message_bus.send.side_effect = OSError("broker down")
+
+        async def send():
+            await producer.send_async(["message"])
+            with self.assertRaises(OSError):
+                await producer.flush_async()
+            # error is reported once
+            await producer.flush_async()
+            self.message_bus.send.side_effect = OSError("broker down")
+            await producer.send_async(["message"])
+            with self.assertRaises(OSError):
+                await producer.close_async()
+
+        self._run(send())
+        self.assertIsNone(producer._drain_task)
+
+    @staticmethod
+    def _consumer(**kwargs):
+        return MessageConsumer(consumer_id='receive', consumer_group='test', \
+            auto_ack='False', message_types=['test'], offset='earliest', \
+            **kwargs)
+
+    def test_012_receive_batch_blocking(self):
+        """Test receive_batch with timeout 0 blocks for the first message."""
+        self.message_bus.receive.side_effect = [b'1', b'2', None]
+        messages = self._consumer().receive_batch(5, timeout=0)
+        self.assertEqual(messages, [b'1', b'2'])
+        timeouts = [call[0][1] for call in \
+            self.message_bus.receive.call_args_list]
+        self.assertEqual(timeouts, [0, None, None])
+
+    def test_013_commit_interval_receive(self):
+        """Test commit_interval acks once the messages were processed."""
+        self.message_bus.receive.side_effect = [b'1', b'2', b'3', None]
+        consumer = self._consumer(commit_interval=2)
+        consumer.receive()
+        consumer.receive()
+        self.message_bus.ack.assert_not_called()
+        # second message counts as processed when the next one is requested
+        consumer.receive()
+        self.message_bus.ack.assert_called_once()
+
+    def test_014_commit_interval_prefetch(self):
+        """Test commit_interval never acks while messages are prefetched."""
+        self.message_bus.receive.side_effect = \
+            [b'1', b'2', b'3', b'4', b'5', b'6', None, None]
+        consumer = self._consumer(commit_interval=2)
+        received = []
+        acked = []
+        self.message_bus.ack.side_effect = lambda *args: \
+            acked.append((len(received), len(consumer._prefetch_buf)))
+        for message in consumer.iter_messages(batch_size=4):
+            received.append(message)
+        self.assertEqual(len(received), 6)
+        self.assertEqual(acked, [(4, 0), (6, 0)])
+
+    def test_015_commit_interval_receive_batch(self):
+        """Test messages from receive_batch count towards commit_interval."""
+        self.message_bus.receive.side_effect = [b'1', b'2', b'3', None]
+        consumer = self._consumer(commit_interval=2)
+        self.assertEqual(len(consumer.receive_batch(2)), 2)
+        self.message_bus.ack.assert_not_called()
+        consumer.receive_batch(2)
+        self.message_bus.ack.assert_called_once()
+
+    def test_016_receive_and_ack(self):
+        """Test receive_and_ack defers the ack behind prefetched messages."""
+        self.message_bus.receive.side_effect = [b'1', b'2', b'3', None]
+        consumer = self._consumer()
+        messages = consumer.iter_messages(batch_size=3)
+        next(messages)
+        self.assertEqual(consumer.receive_and_ack(batch_size=1), [b'2'])
+        self.message_bus.ack.assert_not_called()
+        self.assertEqual(consumer.receive(), b'3')
+        consumer.receive()
+        self.message_bus.ack.assert_called_once()
+
+    def test_017_register_message_type_duplicates(self):
+        """Test duplicate message types are registered once, in order."""
+        admin = MessageBusAdmin(admin_id='register')
+        admin.register_message_type(message_types=['b', 'a', 'b', 'a'], \
+            partitions=1)
+        self.message_bus.register_message_type.assert_called_once_with(\
+            'register', ['b', 'a'], 1)
+
+    def test_018_register_message_type_invalid(self):
+        """Test empty or non-str message types are rejected."""
+        admin = MessageBusAdmin(admin_id='register')
+        for message_types in ([], ['a', ''], ['a', None], [1]):
+            with self.assertRaises(MessageBusError):
+                admin.register_message_type(message_types=message_types, \
+                    partitions=1)
+        self.message_bus.register_message_type.assert_not_called()
+
+    def test_019_missing_message_type(self):
+        """Test send and delete without a message type are rejected."""
+        with self.assertRaises(MessageBusError) as cm:
+            MessageBusAdmin(admin_id='admin').delete()
+        self.assertEqual(cm.exception.rc, errno.ENOENT)
+        self.message_bus.delete.assert_not_called()
+        consumer = self._consumer()
+        with self.assertRaises(MessageBusError) as cm:
+            consumer.send(['message'])
+        self.assertEqual(cm.exception.rc, errno.ENOENT)
+        producer = MessageProducer(producer_id='send', message_type='test', \
+            max_messages=2)
+        producer._client_conf = producer._client_conf._replace(\
+            message_type=None)
+        with self.assertRaises(MessageBusError) as cm:
+            producer.send(['message'])
+        self.assertEqual(cm.exception.rc, errno.ENOENT)
+        self.assertEqual(len(producer._batch), 0)
+        self.message_bus.send.assert_not_called()
+
+    def test_020_client_conf(self):
+        """Test the client conf is read-only and copies message_types."""
+        message_types = ['test']
+        consumer = MessageConsumer(consumer_id='receive', \
+            consumer_group='test', auto_ack='False', \
+            message_types=message_types, offset='earliest')
+        message_types.append('other')
+        self.assertEqual(consumer._client_conf.message_types, ('test',))
+        with self.assertRaises(AttributeError):
+            consumer._client_conf.client_id = 'other'
+        producer = MessageProducer(producer_id='send', message_type='test')
+        self.assertIsNone(producer._client_conf.method)
+
+    def test_021_client_conf_invalid(self):
+        """Test unknown and missing client conf keys are rejected."""
+        with self.assertRaises(MessageBusError) as cm:
+            MessageBusClient(client_type='producer', client_id='send', \
+                message_type='test', batch_size=10)
+        self.assertEqual(cm.exception.rc, errno.EINVAL)
+        self.message_bus.init_client.assert_not_called()
+        admin = MessageBusAdmin(admin_id='admin')
+        with self.assertRaises(MessageBusError) as cm:
+            admin._get_conf('message_type')
+        self.assertEqual(cm.exception.rc, errno.ENOENT)
+
+
+if __name__ == '__main__':
+    unittest.main()